@@ -1,7 +1,10 @@
 class Employee:
+    __slots__ = ("name", "qualifications", "vacations", "qualifications_set")
+
     def __init__(self, name: str, qualifications: list[str], vacations: list[int]):
         self.name = name
         self.qualifications = qualifications
+        self.qualifications_set = frozenset(qualifications)
         self.vacations = vacations
 
     def __str__(self):
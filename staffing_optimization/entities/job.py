@@ -1,4 +1,12 @@
 class Job:
+    __slots__ = (
+        "name",
+        "gain",
+        "due_date",
+        "daily_penalty",
+        "working_days_per_qualification",
+    )
+
     def __init__(
         self,
         name: str,
@@ -1,16 +1,38 @@
-import json
 from typing import TypedDict
 import logging
+import sys
 import gurobipy
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    import orjson as json
+except ImportError:
+    import json
 
 from entities import Employee, Job
 
+# Importing numba and loading its compiled cache costs ~0.4 s per run, while the plain
+# greedy loop runs at ~0.2 us per (employee, job, day) cell: only compile above this
+NUMBA_MIN_CELLS: int = 2_000_000
+
 
 class ProblemData(TypedDict):
     horizon: int
     qualifications: list[str]
     staff: list[Employee]
     jobs: list[Job]
+    # emp_qual_mask[e, q] = True if employee e has qualification q
+    emp_qual_mask: np.ndarray
+    # emp_vac_mask[e, d] = True if employee e is on vacation on day d
+    emp_vac_mask: np.ndarray
+    job_gain: np.ndarray
+    job_due: np.ndarray
+    job_pen: np.ndarray
+    # need[j, q] = number of days of work of qualification q required by job j
+    need: np.ndarray
+    # profits[j, d] = profit of job j if it is finished on day d
+    profits: np.ndarray
 
 
 def get_data(size: str) -> ProblemData:
@@ -23,8 +45,8 @@ def get_data(size: str) -> ProblemData:
     else:
         raise ValueError(f"Unknown size {size}")
 
-    with open(file) as f:
-        data: dict = json.load(f)
+    with open(file, "rb") as f:
+        data: dict = json.loads(f.read())
 
     data["staff"] = [
         Employee(
@@ -32,7 +54,7 @@ def get_data(size: str) -> ProblemData:
             qualifications=employee["qualifications"],
             vacations=employee["vacations"],
         )
-        for index, employee in enumerate(data["staff"])
+        for employee in data["staff"]
     ]
 
     data["jobs"] = [
@@ -43,26 +65,170 @@ def get_data(size: str) -> ProblemData:
             daily_penalty=job["daily_penalty"],
             working_days_per_qualification=job["working_days_per_qualification"],
         )
-        for index, job in enumerate(data["jobs"])
+        for job in data["jobs"]
     ]
 
+    data.update(get_arrays(data))
+
     return data
 
 
-def get_profit(project: Job, end_date: int) -> int:
-    if project.due_date >= end_date:
-        return project.gain
-    return max(project.gain - project.daily_penalty * (end_date - project.due_date), 0)
+def get_arrays(data: dict) -> dict[str, np.ndarray]:
+    staff: list[Employee] = data["staff"]
+    jobs: list[Job] = data["jobs"]
+    qualifications: list[str] = data["qualifications"]
+    E: int = len(staff)
+    J: int = len(jobs)
+    Q: int = len(qualifications)
+    D: int = data["horizon"]
+
+    qualification_indices: dict[str, int] = {
+        qualification: index
+        for index, qualification in enumerate(qualifications)
+    }
+
+    emp_qual_mask: np.ndarray = np.zeros((E, Q), dtype=np.bool_)
+    emp_vac_mask: np.ndarray = np.zeros((E, D), dtype=np.bool_)
+    for employee_index, employee in enumerate(staff):
+        emp_qual_mask[
+            employee_index,
+            [
+                qualification_indices[qualification]
+                for qualification in employee.qualifications_set
+            ],
+        ] = True
+        emp_vac_mask[employee_index, employee.vacations] = True
+
+    job_gain: np.ndarray = np.fromiter(
+        (job.gain for job in jobs), dtype=np.int32, count=J
+    )
+    job_due: np.ndarray = np.fromiter(
+        (job.due_date for job in jobs), dtype=np.int32, count=J
+    )
+    job_pen: np.ndarray = np.fromiter(
+        (job.daily_penalty for job in jobs), dtype=np.int32, count=J
+    )
+
+    need: np.ndarray = np.zeros((J, Q), dtype=np.int16)
+    for job_index, job in enumerate(jobs):
+        for qualification, working_days in job.working_days_per_qualification.items():
+            need[job_index, qualification_indices[qualification]] = working_days
+
+    return {
+        "emp_qual_mask": emp_qual_mask,
+        "emp_vac_mask": emp_vac_mask,
+        "job_gain": job_gain,
+        "job_due": job_due,
+        "job_pen": job_pen,
+        "need": need,
+        "profits": get_profits(job_gain, job_due, job_pen, D),
+    }
+
+
+def get_profits(
+    gains: np.ndarray, due_dates: np.ndarray, daily_penalties: np.ndarray, horizon: int
+) -> np.ndarray:
+    days: np.ndarray = np.arange(horizon, dtype=np.int32)
+    return np.where(
+        due_dates[:, None] >= days[None, :],
+        gains[:, None],
+        np.maximum(
+            gains[:, None] - daily_penalties[:, None] * (days[None, :] - due_dates[:, None]),
+            0,
+        ),
+    )
+
+
+def sum_matrix(shape: tuple[int, ...], axis: int) -> sp.csr_matrix:
+    # A such that A @ x.reshape(-1) == x.sum(axis=axis).reshape(-1) for x of shape shape
+    matrix: sp.csr_matrix = sp.identity(1, format="csr")
+    for dimension, size in enumerate(shape):
+        factor = np.ones((1, size)) if dimension == axis else sp.identity(size)
+        matrix = sp.kron(matrix, factor, format="csr")
+    return matrix
+
+
+def greedy_schedule(
+    has_qualification: np.ndarray,
+    on_vacation: np.ndarray,
+    gains: np.ndarray,
+    due_dates: np.ndarray,
+    need: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    E, Q = has_qualification.shape
+    J = need.shape[0]
+    D = on_vacation.shape[1]
+
+    X_start = np.zeros((E, J, D), dtype=np.int8)
+    Y_start = np.zeros((E, J, Q), dtype=np.int8)
+    Z_start = np.zeros((J, D), dtype=np.int8)
+    staffed = np.zeros(J, dtype=np.bool_)
+
+    busy = on_vacation.copy()
+    # assigned[e] = qualification employee e is assigned to on the current job, or -1
+    assigned = np.empty(E, dtype=np.int64)
+
+    # Staff the most profitable jobs first, each on the earliest free days of
+    # qualified employees up to its due date, and keep a job only if all its
+    # qualifications are covered by then
+    for job_index in np.argsort(-gains, kind="mergesort"):
+        last_day = min(due_dates[job_index] + 1, D)
+        job_busy = busy.copy()
+        assigned[:] = -1
+        finish_day = 0
+        complete = True
+
+        for qualification_index in range(Q):
+            remaining = need[job_index, qualification_index]
+            for employee_index in range(E):
+                if remaining == 0:
+                    break
+                if (
+                    assigned[employee_index] >= 0
+                    or not has_qualification[employee_index, qualification_index]
+                ):
+                    continue
+                for day in range(last_day):
+                    if remaining == 0:
+                        break
+                    if not job_busy[employee_index, day]:
+                        job_busy[employee_index, day] = True
+                        X_start[employee_index, job_index, day] = 1
+                        assigned[employee_index] = qualification_index
+                        finish_day = max(finish_day, day)
+                        remaining -= 1
+            if remaining > 0:
+                complete = False
+                break
+
+        if not complete:
+            X_start[:, job_index, :] = 0
+            continue
+
+        busy = job_busy
+        staffed[job_index] = True
+        for employee_index in range(E):
+            if assigned[employee_index] >= 0:
+                Y_start[employee_index, job_index, assigned[employee_index]] = 1
+        Z_start[job_index, finish_day] = 1
+
+    return X_start, Y_start, Z_start, staffed
 
 
 def solve_problem(
     data: ProblemData,
 ) -> gurobipy.Model:
-    profits_jobs: dict = {
-        (job_index, day): get_profit(job, day)
-        for job_index, job in enumerate(data["jobs"])
-        for day in range(data["horizon"])
-    }
+    has_qualification: np.ndarray = data["emp_qual_mask"]
+    on_vacation: np.ndarray = data["emp_vac_mask"]
+    need: np.ndarray = data["need"]
+
+    E, Q = has_qualification.shape
+    J: int = need.shape[0]
+    D: int = data["horizon"]
+
+    # profits_jobs[j, d] = profit of job j if it is finished on day d
+    profits_jobs: np.ndarray = data["profits"]
+
     model: gurobipy.Model = gurobipy.Model()
 
     # Create variables
@@ -70,29 +236,20 @@ def solve_problem(
     # Y[e, j, q] = 1 if employee e is assigned to job j for qualification q
     # Z[j, d] = 1 if job j is finished on day d
 
-    X: gurobipy.tupledict = model.addVars(
-        len(data["staff"]),
-        len(data["jobs"]),
-        data["horizon"],
-        vtype=gurobipy.GRB.BINARY,
-        name="X",
-    )
+    X: gurobipy.MVar = model.addMVar((E, J, D), vtype=gurobipy.GRB.BINARY, name="X")
 
-    Y: gurobipy.tupledict = model.addVars(
-        len(data["staff"]),
-        len(data["jobs"]),
-        len(data["qualifications"]),
-        vtype=gurobipy.GRB.BINARY,
-        name="Y",
-    )
+    Y: gurobipy.MVar = model.addMVar((E, J, Q), vtype=gurobipy.GRB.BINARY, name="Y")
+
+    Z: gurobipy.MVar = model.addMVar((J, D), vtype=gurobipy.GRB.BINARY, name="Z")
 
-    Z: gurobipy.tupledict = model.addVars(
-        len(data["jobs"]),
-        data["horizon"],
-        vtype=gurobipy.GRB.BINARY,
-        name="Z",
+    # W[e, j, q, d] = X[e, j, d] * Y[e, j, q], linearized below
+    W: gurobipy.MVar = model.addMVar(
+        (E, J, Q, D), vtype=gurobipy.GRB.BINARY, name="W"
     )
 
+    # C[j, q, d] = number of days of qualification q staffed on job j up to day d
+    C: gurobipy.MVar = model.addMVar((J, Q, D), name="C")
+
     # Preference 2: Minimize the number of jobs staffed for the person with the most jobs
     # Minimize(max(number_of_jobs_staffed)) for all employees
     # A = model.addVar(
@@ -102,16 +259,7 @@ def solve_problem(
     #     ub=len(data["jobs"]),
     # )
 
-    model.update()
-
-    model.setObjective(
-        gurobipy.quicksum(
-            profits_jobs[job_index, day] * Z[job_index, day]
-            for job_index, _ in enumerate(data["jobs"])
-            for day in range(data["horizon"])
-        ),
-        gurobipy.GRB.MAXIMIZE,
-    )
+    model.setObjective((profits_jobs * Z).sum(), gurobipy.GRB.MAXIMIZE)
 
     # TODO: Fix preferences below to have a multi-objective optimization
     # model.addConstr(
@@ -155,116 +303,61 @@ def solve_problem(
     # Add constraints
 
     # Constraint 1 : An employee can only be assigned to a project qualification if he has this qualification
-    model.addConstrs(
-        (
-            Y[employee_index, job_index, qualification_index] == 0
-            for employee_index, employee in enumerate(data["staff"])
-            for job_index, _ in enumerate(data["jobs"])
-            for qualification_index, qualification in enumerate(data["qualifications"])
-            if qualification not in employee.qualifications
-        ),
-        name="Need to have qualification to work on a job",
-    )
+    # Y[e, j, q] = 0 for all j if employee e lacks qualification q
+    Y[~np.broadcast_to(has_qualification[:, None, :], (E, J, Q))].UB = 0
 
     # Constraint 2: An employee can only be assigned to one qualification for a job
     # Number of qualifications per employee per job <= 1
-    model.addConstrs(
-        (
-            gurobipy.quicksum(
-                Y[employee_index, job_index, qualification_index]
-                for qualification_index, _ in enumerate(data["qualifications"])
-            )
-            <= 1
-            for employee_index, _ in enumerate(data["staff"])
-            for job_index, _ in enumerate(data["jobs"])
-        ),
+    model.addMConstr(
+        sum_matrix((E, J, Q), axis=2),
+        Y.reshape(-1),
+        gurobipy.GRB.LESS_EQUAL,
+        np.ones(E * J),
         name="One qualification per employee per job",
     )
 
     # Constraint 3 : An employee can only be assigned to one project per day
     # Number of jobs per employee per day <= 1
-    model.addConstrs(
-        (
-            gurobipy.quicksum(
-                X[employee_index, job_index, day]
-                for job_index, _ in enumerate(data["jobs"])
-            )
-            <= 1
-            for employee_index, _ in enumerate(data["staff"])
-            for day in range(data["horizon"])
-        ),
+    model.addMConstr(
+        sum_matrix((E, J, D), axis=1),
+        X.reshape(-1),
+        gurobipy.GRB.LESS_EQUAL,
+        np.ones(E * D),
         name="One job per employee per day",
     )
 
     # Constraint 4: An employee must not work on a day of vacation
     # X[e, j, d] = 0 if d in employee e vacations
-    model.addConstrs(
-        (
-            X[employee_index, job_index, day] == 0
-            for employee_index, employee in enumerate(data["staff"])
-            for job_index, _ in enumerate(data["jobs"])
-            for day in employee.vacations
-        ),
-        name="No work on vacation",
-    )
-
-    # Constraint 4: An employee must not work on a day of vacation
-    # X[e, j, d] = 0 if d in employee e vacations
-    model.addConstrs(
-        (
-            X[employee_index, job_index, day] == 0
-            for employee_index, employee in enumerate(data["staff"])
-            for job_index, _ in enumerate(data["jobs"])
-            for day in employee.vacations
-        ),
-        name="No work on vacation",
-    )
+    X[np.broadcast_to(on_vacation[:, None, :], (E, J, D))].UB = 0
 
     # New constraint to help?
     # Nobody can be staffed to a job once a job is finished
     # Constraint 5: A project is realized when each qualification has been staffed
     # the right number of days
 
-    # Z[j, d] = 1 if for all days d in 0..d,
-    # sum(Y[e, j, q] * X[e, j, d]) == working_days_per_qualification[q] for all q
-    # TODO: The code below doesn't work, because it needs to be done only the last day of execution and not the days after
-    model.addConstrs(
-        (
-            Z[job_index, day] == 1
-            if gurobipy.and_(
-                gurobipy.all_(
-                    gurobipy.quicksum(
-                        Y[employee_index, job_index, qualification_index]
-                        * X[employee_index, job_index, day_2]
-                        for employee_index, _ in enumerate(data["staff"])
-                        for day_2 in range(day + 1)
-                    )
-                    == job.working_days_per_qualification.get(qualification, 0)
-                    for qualification_index, qualification in enumerate(
-                        data["qualifications"]
-                    )
-                ),
-                gurobipy.quicksum(
-                    X[employee_index, job_index, day]
-                    for employee_index, _ in enumerate(data["staff"])
-                )
-                >= 1,
-            )
-            else 0
-            for job_index, job in enumerate(data["jobs"])
-            for day in range(data["horizon"])
-        ),
+    # C[j, q, d] = sum(W[e, j, q, d'] for e in staff for d' in 0..d)
+    model.addConstr(
+        C[:, :, 0] == W[:, :, :, 0].sum(axis=0), name="Staffed days on first day"
+    )
+    model.addConstr(
+        C[:, :, 1:] == C[:, :, :-1] + W[:, :, :, 1:].sum(axis=0),
+        name="Cumulative staffed days",
+    )
+
+    # Z[j, d] = 1 => C[j, q, d] >= working_days_per_qualification[q] for all q
+    # <=> C[j, q, d] >= working_days_per_qualification[q] * Z[j, d] since C >= 0
+    model.addConstr(
+        C >= need[:, :, None] * Z[:, None, :],
         name="Project is realized when each qualification has been staffed the right "
         "number of days",
     )
 
-    # Constraint 6: A project can only be realized once
-    model.addConstrs(
-        (
-            gurobipy.quicksum(Z[job_index, day]
-                              for day in range(data["horizon"])) == 1
-            for job_index, _ in enumerate(data["jobs"])
-        ),
+    # Constraint 6: A project can only be realized once, and doesn't have to be
+    model.addMConstr(
+        sum_matrix((J, D), axis=1),
+        Z.reshape(-1),
+        gurobipy.GRB.LESS_EQUAL,
+        np.ones(J),
         name="A job can only be realized once",
     )
 
@@ -272,34 +365,23 @@ def solve_problem(
     # job at least one day
     # Y[e, j, q] = 1 => sum(X[e, j, d] for d in 0..horizon) >= 1
     # <=> sum(X[e, j, d] for d in 0..horizon) >= Y[e, j, q]
-    model.addConstrs(
-        (
-            gurobipy.quicksum(
-                X[employee_index, job_index, day] for day in range(data["horizon"])
-            )
-            >= Y[employee_index, job_index, qualification_index]
-            for employee_index, _ in enumerate(data["staff"])
-            for job_index, _ in enumerate(data["jobs"])
-            for qualification_index, qualification in enumerate(data["qualifications"])
-        ),
+    model.addConstr(
+        X.sum(axis=2)[:, :, None] >= Y,
         name="If an employee is assigned to a job for a qualification, he must work for this job at least one day",
     )
 
     # You can't assign more days of work of qualification than the number of days of
-    # work of the qualification sum(X[e, j, d] for d in 0..horizon) <=
-    # working_days_per_qualification[q] * Y[e, j, q]
-    model.addConstrs(
-        (
-            gurobipy.quicksum(
-                X[employee_index, job_index, day]
-                * Y[employee_index, job_index, qualification_index]
-                for employee_index, _ in enumerate(data["staff"])
-                for day in range(data["horizon"])
-            )
-            <= job.working_days_per_qualification.get(qualification, 0)
-            for job_index, job in enumerate(data["jobs"])
-            for qualification_index, qualification in enumerate(data["qualifications"])
-        ),
+    # work of the qualification
+    # sum(W[e, j, q, d] for e in staff for d in 0..horizon) <= working_days_per_qualification[q]
+    # with W[e, j, q, d] = 1 <=> X[e, j, d] = 1 and Y[e, j, q] = 1
+    model.addConstr(W <= X[:, :, None, :], name="W <= X")
+    model.addConstr(W <= Y[:, :, :, None], name="W <= Y")
+    model.addConstr(
+        W >= X[:, :, None, :] + Y[:, :, :, None] - 1, name="W >= X + Y - 1"
+    )
+
+    model.addConstr(
+        W.sum(axis=(0, 3)) <= need,
         name="Staffed days of qualification <= number of days of work of the qualification",
     )
 
@@ -310,39 +392,52 @@ def solve_problem(
     # Constraint 7: The problem takes place over a given period of time
     # Already solved?
 
+    model.update()
+
+    # Warm start from a greedy schedule, leaving the jobs it couldn't staff undefined
+    schedule = greedy_schedule
+    if E * J * D > NUMBA_MIN_CELLS:
+        try:
+            from numba import njit
+
+            schedule = njit(cache=True)(greedy_schedule)
+        except ImportError:
+            pass
+    X_start, Y_start, Z_start, staffed = schedule(
+        has_qualification, on_vacation, data["job_gain"], data["job_due"], need
+    )
+    X.Start = np.where(staffed[None, :, None], X_start, gurobipy.GRB.UNDEFINED)
+    Y.Start = np.where(staffed[None, :, None], Y_start, gurobipy.GRB.UNDEFINED)
+    Z.Start = np.where(staffed[:, None], Z_start, gurobipy.GRB.UNDEFINED)
+
+    # Solver parameters tuned for this binary assignment MILP
+    model.Params.Method = 2  # Barrier for the root relaxation
+    model.Params.Threads = 0  # Use all available cores
+    model.Params.MIPFocus = 1  # Focus on finding feasible solutions
+    model.Params.Presolve = 2  # Aggressive presolve
+    model.Params.Heuristics = 0.2
+    model.Params.Cuts = 2  # Aggressive cut generation
+
     model.optimize()
 
     if model.Status == gurobipy.GRB.OPTIMAL:
-        print("Optimal solution found", model.ObjVal)
-        for v in model.getVars():
-            if v.x == 1:
-                if v.varName[0] == "X":
-                    print(
-                        "Employee",
-                        data["staff"][int(v.varName[2])].name,
-                        "works on job",
-                        data["jobs"][int(v.varName[4])].name,
-                        "on day",
-                        int(v.varName[6]),
-                    )
-                elif v.varName[0] == "Y":
-                    print(
-                        "Employee",
-                        data["staff"][int(v.varName[2])].name,
-                        "is assigned to job",
-                        data["jobs"][int(v.varName[4])].name,
-                        "for qualification",
-                        data["qualifications"][int(v.varName[6])],
-                    )
-                elif v.varName[0] == "Z":
-                    print(
-                        "Job",
-                        data["jobs"][int(v.varName[2])].name,
-                        "is finished on day",
-                        int(v.varName[4]),
-                    )
-
-        print("Objective value:", model.ObjVal)
+        lines: list[str] = [f"Optimal solution found {model.ObjVal}"]
+        for employee_index, job_index, day in np.argwhere(X.X > 0.5):
+            lines.append(
+                f"Employee {data['staff'][employee_index].name} works on job "
+                f"{data['jobs'][job_index].name} on day {day}"
+            )
+        for employee_index, job_index, qualification_index in np.argwhere(Y.X > 0.5):
+            lines.append(
+                f"Employee {data['staff'][employee_index].name} is assigned to job "
+                f"{data['jobs'][job_index].name} for qualification "
+                f"{data['qualifications'][qualification_index]}"
+            )
+        for job_index, day in np.argwhere(Z.X > 0.5):
+            lines.append(f"Job {data['jobs'][job_index].name} is finished on day {day}")
+
+        lines.append(f"Objective value: {model.ObjVal}")
+        sys.stdout.write("\n".join(lines) + "\n")
     return model
 
 